@@ -6,6 +6,7 @@ Copyright (C) 2022 Lutra Consulting
 License: MIT
 """
 
+import json
 import pathlib
 import platform
 import smtplib
@@ -25,34 +26,58 @@ config = Dynaconf(
 )
 
 
+# settings checked by validate_config() function below
+VALIDATED_SETTINGS = [
+    "geodiff_exe",
+    "mergin",
+    "connections",
+    "init_from",
+    "notification",
+]
+
+# parameters required for each connection (in the order they are reported when missing)
+REQUIRED_CONNECTION_SETTINGS = (
+    "driver",
+    "conn_info",
+    "modified",
+    "base",
+    "mergin_project",
+    "sync_file",
+)
+REQUIRED_CONNECTION_SETTINGS_SET = frozenset(REQUIRED_CONNECTION_SETTINGS)
+
+SUPPORTED_DRIVERS = frozenset(["postgres"])
+
+# key of the last config that passed validate_config() - see _config_validation_key()
+_last_valid_config_key = None
+
+
 class ConfigError(Exception):
     pass
 
 
+def _config_validation_key(config) -> str:
+    """Returns a string that only changes when some of the validated settings change"""
+    settings = {setting: config[setting] for setting in VALIDATED_SETTINGS if setting in config}
+    return json.dumps(settings, sort_keys=True, default=str)
+
+
 def validate_config(config):
     """Validate config - make sure values are consistent"""
+    global _last_valid_config_key
 
-    # validate that geodiff can be found, otherwise it does not make sense to run DB Sync
-    try:
-        subprocess.run(
-            [
-                config.geodiff_exe,
-                "help",
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-    except FileNotFoundError:
-        raise ConfigError(
-            "Config error: Geodiff executable not found. Is it installed and available in `PATH` environment variable?"
-        )
-
-    if not (config.mergin.url and config.mergin.username and config.mergin.password):
-        raise ConfigError("Config error: Incorrect mergin settings")
+    # skip the (possibly slow) validation if the same settings were validated already
+    config_key = _config_validation_key(config)
+    if config_key == _last_valid_config_key:
+        return
 
+    # cheap checks of the values go first, checks that need to run external programs come last
     if not (config.connections and len(config.connections)):
         raise ConfigError("Config error: Connections list can not be empty")
 
+    if not (config.mergin.url and config.mergin.username and config.mergin.password):
+        raise ConfigError("Config error: Incorrect mergin settings")
+
     if "init_from" not in config:
         raise ConfigError("Config error: Missing parameter `init_from` in the configuration.")
 
@@ -65,23 +90,18 @@ def validate_config(config):
         )
 
     for conn in config.connections:
-        for attr in [
-            "driver",
-            "conn_info",
-            "modified",
-            "base",
-            "mergin_project",
-            "sync_file",
-        ]:
-            if not hasattr(
-                conn,
-                attr,
-            ):
-                raise ConfigError(
-                    f"Config error: Incorrect connection settings. Required parameter `{attr}` is missing."
-                )
-
-        if conn.driver != "postgres":
+        # quick check first - keys may use different letter case, so only then look for the missing one
+        if not isinstance(conn, dict) or not REQUIRED_CONNECTION_SETTINGS_SET.issubset(conn.keys()):
+            for attr in REQUIRED_CONNECTION_SETTINGS:
+                if not hasattr(
+                    conn,
+                    attr,
+                ):
+                    raise ConfigError(
+                        f"Config error: Incorrect connection settings. Required parameter `{attr}` is missing."
+                    )
+
+        if conn.driver not in SUPPORTED_DRIVERS:
             raise ConfigError("Config error: Only 'postgres' driver is currently supported.")
 
         if "/" not in conn.mergin_project:
@@ -103,6 +123,21 @@ def validate_config(config):
             ):
                 raise ConfigError("Config error: Ignored tables parameter should be a list")
 
+    # validate that geodiff can be found, otherwise it does not make sense to run DB Sync
+    try:
+        subprocess.run(
+            [
+                config.geodiff_exe,
+                "help",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        raise ConfigError(
+            "Config error: Geodiff executable not found. Is it installed and available in `PATH` environment variable?"
+        )
+
     if "notification" in config:
         settings = [
             "smtp_server",
@@ -143,6 +178,8 @@ def validate_config(config):
                 err = str(e.smtp_error)
             raise ConfigError(f"Config SMTP Error: {err}.")
 
+    _last_valid_config_key = config_key
+
 
 def get_ignored_tables(
     connection,
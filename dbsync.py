@@ -6,21 +6,29 @@ Copyright (C) 2020 Lutra Consulting
 License: MIT
 """
 
+import atexit
+import base64
+import concurrent.futures
+import contextlib
 import getpass
 import json
 import os
+import platform
 import shutil
-import string
 import subprocess
 import tempfile
-import random
 import uuid
+import weakref
 import re
+import select
 import pathlib
 import logging
+import threading
 
 import psycopg2
 import psycopg2.extensions
+import psycopg2.pool
+import pygeodiff
 from psycopg2 import (
     sql,
 )
@@ -28,6 +36,12 @@ from itertools import (
     chain,
 )
 
+try:
+    # faster parsing and serialization of JSON (listed in requirements, standard json module is used without it)
+    import orjson
+except ImportError:
+    orjson = None
+
 from mergin import (
     MerginClient,
     MerginProject,
@@ -45,12 +59,56 @@ from config import (
     ConfigError,
 )
 
-# set high logging level for geodiff (used by geodiff executable)
-# so we get as much information as possible
-os.environ["GEODIFF_LOGGER_LEVEL"] = "4"  # 0 = nothing, 1 = errors, 2 = warning, 3 = info, 4 = debug
-
 FORCE_INIT_MESSAGE = "Running `dbsync_deamon.py` with `--force-init` should fix the issue."
 
+# maximum number of Mergin Maps projects processed in parallel (and of connections to a single database)
+MAX_PARALLEL_PROJECTS = 8
+
+# names of operations in changeset entries as used in geodiff JSON output
+GEODIFF_OPERATION_NAMES = {
+    pygeodiff.ChangesetEntry.OP_INSERT: "insert",
+    pygeodiff.ChangesetEntry.OP_UPDATE: "update",
+    pygeodiff.ChangesetEntry.OP_DELETE: "delete",
+}
+
+
+# directory for temporary files (changesets etc.) of this process - created once and removed on exit,
+# so that stale files from earlier runs never get mixed with the current ones (files in it are removed
+# right after use, as the process may get killed without running the exit handlers)
+TMP_DIR = tempfile.mkdtemp(prefix="dbsync-")
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+
+
+def _json_loads(data):
+    """Parses JSON from str or bytes (using orjson if available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    """Serializes object to compact JSON (using orjson if available)"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def _silent_unlink(path) -> None:
+    """Removes a file, does nothing if it does not exist"""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+
+@contextlib.contextmanager
+def _temporary_files(*paths):
+    """Removes the given temporary files when leaving the block (changesets hold data from the database,
+    so they should not stay around until the process exits)"""
+    try:
+        yield
+    finally:
+        for path in paths:
+            _silent_unlink(path)
+
 
 class DbSyncError(Exception):
     default_print_password = "password='*****'"
@@ -90,12 +148,6 @@ def _add_quotes_to_schema_name(
     return schema
 
 
-def _tables_list_to_string(
-    tables,
-):
-    return ";".join(tables)
-
-
 def _check_has_working_dir(
     work_path,
 ):
@@ -121,6 +173,80 @@ def _check_has_sync_file(
         raise DbSyncError("The output GPKG file does not exist: " + file_path)
 
 
+# Dictionary used by _db_connection() function below.
+# key = connection string to the database, value = pool of connections to the database
+db_connection_pools = {}
+db_connection_pools_lock = threading.Lock()
+
+
+def _is_db_connection_alive(
+    conn: psycopg2.extensions.connection,
+) -> bool:
+    """Checks that an idle connection has not been closed by the server in the meantime (without querying it)"""
+    if conn.closed:
+        return False
+    # nothing should arrive on an idle connection - if there is something to read, the server has closed it
+    readable, _, _ = select.select([conn], [], [], 0)
+    return not readable
+
+
+@contextlib.contextmanager
+def _db_connection(
+    conn_info: str,
+):
+    """
+    Context manager providing a connection to the database from a pool of connections, so that
+    we do not need to connect (and authenticate) again every time we need to query the database.
+    The connection is returned to the pool when done - any uncommitted transaction gets rolled back.
+    """
+    try:
+        with db_connection_pools_lock:
+            if conn_info not in db_connection_pools:
+                pool = psycopg2.pool.ThreadedConnectionPool(1, MAX_PARALLEL_PROJECTS, conn_info)
+                # the pool closes returned connections above `minconn` - keep one for each parallel worker, but
+                # set it only after creating the pool, which would otherwise open all of them right away
+                pool.minconn = MAX_PARALLEL_PROJECTS
+                db_connection_pools[conn_info] = pool
+            pool = db_connection_pools[conn_info]
+        conn = pool.getconn()
+        if not _is_db_connection_alive(conn):
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+    except psycopg2.Error as e:
+        raise DbSyncError("Unable to connect to the database: " + str(e))
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+# Statements for queries we run repeatedly - each of them gets prepared on its first use on a connection
+# by _execute_prepared_statement() function below, so that the server does not need to parse it every time
+DB_PREPARED_STATEMENTS = {
+    "dbsync_schemas_exist": "PREPARE dbsync_schemas_exist(text[]) AS "
+    "SELECT nspname FROM pg_namespace WHERE nspname = ANY($1)",
+    "dbsync_schema_comment": "PREPARE dbsync_schema_comment(text) AS "
+    "SELECT obj_description($1::regnamespace, 'pg_namespace')",
+}
+# Dictionary used by _execute_prepared_statement() function below.
+# key = connection, value = set of names of statements already prepared on the connection
+prepared_db_statements = weakref.WeakKeyDictionary()
+
+
+def _execute_prepared_statement(
+    cur: psycopg2.extensions.cursor,
+    name: str,
+    params: tuple,
+) -> None:
+    """Executes a statement from DB_PREPARED_STATEMENTS, preparing it first if not done for the connection yet
+    (prepared statements live as long as the connection, they are not affected by rollback)"""
+    prepared = prepared_db_statements.setdefault(cur.connection, set())
+    if name not in prepared:
+        cur.execute(DB_PREPARED_STATEMENTS[name])
+        prepared.add(name)
+    cur.execute(f"EXECUTE {name}(%s)", params)
+
+
 def _drop_schema(
     conn,
     schema_name: str,
@@ -142,6 +268,21 @@ def _check_schema_exists(
     return cur.fetchone()[0]
 
 
+def _check_schemas_exist(
+    conn,
+    schema_names,
+):
+    """Checks existence of several schemas with a single query - returns a dictionary schema name -> bool"""
+    with conn.cursor() as cur:
+        _execute_prepared_statement(
+            cur,
+            "dbsync_schemas_exist",
+            (list(schema_names),),
+        )
+        found = {row[0] for row in cur.fetchall()}
+    return {schema_name: schema_name in found for schema_name in schema_names}
+
+
 def _check_postgis_available(
     conn: psycopg2.extensions.connection,
 ) -> bool:
@@ -163,6 +304,8 @@ def _try_install_postgis(
     cur = conn.cursor()
     try:
         cur.execute("CREATE EXTENSION postgis;")
+        # commit so that the extension is available also for geodiff's own connections
+        conn.commit()
         return True
     except psycopg2.ProgrammingError:
         return False
@@ -176,22 +319,180 @@ def _check_has_password():
         )
 
 
+def _find_geodiff_lib():
+    """Returns path to the geodiff shared library that gets built together with the geodiff executable
+    (with PostgreSQL support). Returns None if not found."""
+    geodiff_exe = shutil.which(config.geodiff_exe)
+    if geodiff_exe is None:
+        return None
+    if platform.system() == "Windows":
+        lib_name = "geodiff.dll"
+    elif platform.system() == "Darwin":
+        lib_name = "libgeodiff.dylib"
+    else:
+        lib_name = "libgeodiff.so"
+    exe_dir = os.path.dirname(os.path.realpath(geodiff_exe))
+    for lib_dir in [
+        exe_dir,
+        os.path.join(exe_dir, os.pardir, "lib"),
+    ]:
+        lib_path = os.path.join(lib_dir, lib_name)
+        if os.path.exists(lib_path):
+            return os.path.abspath(lib_path)
+    return None
+
+
+def _geodiff_logger_callback(
+    level,
+    text_bytes,
+):
+    """Forwards messages from geodiff library to our log"""
+    text = text_bytes.decode(errors="replace")
+    if level == pygeodiff.GeoDiff.LevelError:
+        logging.error("GEODIFF: " + text)
+    elif level == pygeodiff.GeoDiff.LevelWarning:
+        logging.warning("GEODIFF: " + text)
+    else:
+        logging.debug("GEODIFF: " + text)
+
+
+# GeoDiff objects used by _get_geodiff() function below - one for each thread,
+# as geodiff context (e.g. tables to skip) must not be shared between threads
+cached_geodiff = threading.local()
+
+# Whether geodiff executable is used for operations with database drivers, set by _get_geodiff() function below.
+# That is the case when geodiff library with PostgreSQL support can not be loaded (e.g. its version does not match
+# the version of pygeodiff) - library bundled with pygeodiff is still used for operations with changeset files.
+geodiff_use_executable = False
+
+# geodiff functions that are run with geodiff executable when geodiff_use_executable is set:
+# value = (geodiff command, number of drivers in the arguments)
+GEODIFF_EXECUTABLE_COMMANDS = {
+    "create_changeset_ex": ("diff", 1),
+    "apply_changeset_ex": ("apply", 1),
+    "rebase_ex": ("rebase-db", 1),
+    "create_changeset_dr": ("diff", 2),
+    "make_copy": ("copy", 2),
+}
+
+
+def _load_geodiff_with_postgres():
+    """Returns GeoDiff object using the geodiff library with PostgreSQL support,
+    or None (with the reason logged) if such library can not be loaded"""
+    lib_path = _find_geodiff_lib()
+    if lib_path is None:
+        logging.debug("Geodiff library was not found next to geodiff executable")
+        return None
+    try:
+        geodiff = pygeodiff.GeoDiff(lib_path)
+    except (
+        OSError,
+        pygeodiff.GeoDiffLibError,
+    ) as e:
+        logging.debug(f"Unable to load geodiff library {lib_path}: {e}")
+        return None
+    if not geodiff.driver_is_registered("postgres"):
+        logging.debug(f"Geodiff library {lib_path} is not compiled with PostgreSQL support")
+        return None
+    return geodiff
+
+
+def _get_geodiff() -> pygeodiff.GeoDiff:
+    """
+    Returns a cached GeoDiff object (of the current thread) or creates one if it does not exist yet.
+    We call geodiff library directly rather than running geodiff executable for each operation,
+    so that we avoid starting a new process (and loading the library again) every time.
+    If the library with PostgreSQL support can not be used, operations with database drivers
+    fall back to geodiff executable (see geodiff_use_executable).
+    """
+    global geodiff_use_executable
+
+    if getattr(cached_geodiff, "geodiff", None) is None:
+        geodiff = None
+        if not geodiff_use_executable:
+            geodiff = _load_geodiff_with_postgres()
+            if geodiff is None:
+                logging.warning(
+                    "Unable to use geodiff library with PostgreSQL support - falling back to geodiff executable. "
+                    "The library needs to be of the same version as pygeodiff " + pygeodiff.geodifflib.__version__
+                )
+                geodiff_use_executable = True
+        if geodiff is None:
+            try:
+                geodiff = pygeodiff.GeoDiff()
+            except (
+                OSError,
+                pygeodiff.GeoDiffLibError,
+            ) as e:
+                raise DbSyncError("Unable to load geodiff library: " + str(e))
+        # set high logging level for geodiff so we get as much information as possible
+        geodiff.set_logger_callback(_geodiff_logger_callback)
+        geodiff.set_maximum_logger_level(pygeodiff.GeoDiff.LevelDebug)
+        cached_geodiff.geodiff = geodiff
+    return cached_geodiff.geodiff
+
+
 def _run_geodiff(
     cmd,
 ):
     """will run a command (with geodiff) and report what got to stderr and raise exception
     if the command returns non-zero exit code"""
-    res = subprocess.run(
-        cmd,
-        stderr=subprocess.PIPE,
-    )
-    geodiff_stderr = res.stderr.decode()
+    try:
+        res = subprocess.run(
+            cmd,
+            stderr=subprocess.PIPE,
+            # so we get as much information as possible: 0 = nothing, 1 = errors, 2 = warning, 3 = info, 4 = debug
+            env={**os.environ, "GEODIFF_LOGGER_LEVEL": "4"},
+        )
+    except OSError as e:
+        raise DbSyncError("Unable to run geodiff executable: " + str(e))
+    geodiff_stderr = res.stderr.decode(errors="replace")
     if geodiff_stderr:
         logging.error("GEODIFF: " + geodiff_stderr)
     if res.returncode != 0:
         raise DbSyncError("geodiff failed!\n" + str(cmd))
 
 
+def _geodiff_executable_command(
+    func_name,
+    ignored_tables,
+    *args,
+):
+    """Returns geodiff executable command equivalent to a call of the geodiff library function"""
+    command, drivers_count = GEODIFF_EXECUTABLE_COMMANDS[func_name]
+    cmd = [
+        config.geodiff_exe,
+        command,
+    ]
+    if drivers_count == 1:
+        cmd += ["--driver", args[0], args[1]]
+        datasets = args[2:]
+    else:
+        cmd += ["--driver-1", args[0], args[1], "--driver-2", args[3], args[4]]
+        datasets = (args[2],) + args[5:]
+    if ignored_tables:
+        cmd += ["--skip-tables", ";".join(ignored_tables)]
+    return cmd + list(datasets)
+
+
+def _call_geodiff(
+    func_name,
+    ignored_tables,
+    *args,
+):
+    """will call a function of geodiff library (with given tables skipped) and raise exception
+    if the function fails"""
+    geodiff = _get_geodiff()
+    if geodiff_use_executable and func_name in GEODIFF_EXECUTABLE_COMMANDS:
+        _run_geodiff(_geodiff_executable_command(func_name, ignored_tables, *args))
+        return
+    geodiff.set_tables_to_skip(ignored_tables if ignored_tables else [])
+    try:
+        getattr(geodiff, func_name)(*args)
+    except pygeodiff.GeoDiffLibError as e:
+        raise DbSyncError("geodiff failed!\n" + str([func_name, *args]) + "\n" + str(e))
+
+
 def _geodiff_create_changeset(
     driver,
     conn_info,
@@ -200,34 +501,15 @@ def _geodiff_create_changeset(
     changeset,
     ignored_tables,
 ):
-    if ignored_tables:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "diff",
-                "--driver",
-                driver,
-                conn_info,
-                "--skip-tables",
-                _tables_list_to_string(ignored_tables),
-                base,
-                modified,
-                changeset,
-            ]
-        )
-    else:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "diff",
-                "--driver",
-                driver,
-                conn_info,
-                base,
-                modified,
-                changeset,
-            ]
-        )
+    _call_geodiff(
+        "create_changeset_ex",
+        ignored_tables,
+        driver,
+        conn_info,
+        base,
+        modified,
+        changeset,
+    )
 
 
 def _geodiff_apply_changeset(
@@ -237,32 +519,33 @@ def _geodiff_apply_changeset(
     changeset,
     ignored_tables,
 ):
-    if ignored_tables:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "apply",
-                "--driver",
-                driver,
-                conn_info,
-                "--skip-tables",
-                _tables_list_to_string(ignored_tables),
-                base,
-                changeset,
-            ]
-        )
-    else:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "apply",
-                "--driver",
-                driver,
-                conn_info,
-                base,
-                changeset,
-            ]
-        )
+    _call_geodiff(
+        "apply_changeset_ex",
+        ignored_tables,
+        driver,
+        conn_info,
+        base,
+        changeset,
+    )
+
+
+def _geodiff_apply_changeset_to_many(
+    driver,
+    conn_info,
+    schemas,
+    changeset,
+    ignored_tables,
+):
+    """Applies the same changeset to several (distinct) schemas. Each geodiff apply runs in its own
+    transaction, so the schemas are patched concurrently rather than one after another."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(schemas)) as executor:
+        futures = [
+            executor.submit(_geodiff_apply_changeset, driver, conn_info, schema, changeset, ignored_tables)
+            for schema in schemas
+        ]
+        # consuming the results re-raises the first error (if any)
+        for future in futures:
+            future.result()
 
 
 def _geodiff_rebase(
@@ -274,36 +557,35 @@ def _geodiff_rebase(
     conflicts,
     ignored_tables,
 ):
-    if ignored_tables:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "rebase-db",
-                "--driver",
-                driver,
-                conn_info,
-                "--skip-tables",
-                _tables_list_to_string(ignored_tables),
-                base,
-                our,
-                base2their,
-                conflicts,
-            ]
-        )
-    else:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "rebase-db",
-                "--driver",
-                driver,
-                conn_info,
-                base,
-                our,
-                base2their,
-                conflicts,
-            ]
-        )
+    _call_geodiff(
+        "rebase_ex",
+        ignored_tables,
+        driver,
+        conn_info,
+        base,
+        our,
+        base2their,
+        conflicts,
+    )
+
+
+def _geodiff_value_to_json(
+    value,
+):
+    """Converts a value read from changeset to the form used in geodiff JSON output"""
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    return value
+
+
+def _geodiff_has_changes(
+    changeset,
+):
+    """Returns whether the changeset contains any changes - without reading the whole changeset"""
+    try:
+        return _get_geodiff().has_changes(changeset)
+    except pygeodiff.GeoDiffLibError as e:
+        raise DbSyncError("geodiff failed!\n" + str(["has_changes", changeset]) + "\n" + str(e))
 
 
 def _geodiff_list_changes_details(
@@ -311,26 +593,32 @@ def _geodiff_list_changes_details(
 ):
     """Returns a list with changeset details:
     [ { 'table': 'foo', 'type': 'update', 'changes': [ ... old/new column values ... ] }, ... ]
+    The changeset is read directly with geodiff's changeset reader, without going through JSON.
     """
-    tmp_dir = tempfile.gettempdir()
-    tmp_output = os.path.join(
-        tmp_dir,
-        "dbsync-changeset-details",
-    )
-    if os.path.exists(tmp_output):
-        os.remove(tmp_output)
-    _run_geodiff(
-        [
-            config.geodiff_exe,
-            "as-json",
-            changeset,
-            tmp_output,
-        ]
-    )
-    with open(tmp_output) as f:
-        out = json.load(f)
-    os.remove(tmp_output)
-    return out["geodiff"]
+    details = []
+    try:
+        for entry in _get_geodiff().read_changeset(changeset):
+            old_values = getattr(entry, "old_values", [pygeodiff.UndefinedValue()] * entry.values_count)
+            new_values = getattr(entry, "new_values", [pygeodiff.UndefinedValue()] * entry.values_count)
+            changes = []
+            for i, (old, new) in enumerate(zip(old_values, new_values)):
+                change = {"column": i}
+                if not isinstance(old, pygeodiff.UndefinedValue):
+                    change["old"] = _geodiff_value_to_json(old)
+                if not isinstance(new, pygeodiff.UndefinedValue):
+                    change["new"] = _geodiff_value_to_json(new)
+                if len(change) > 1:
+                    changes.append(change)
+            details.append(
+                {
+                    "table": entry.table.name,
+                    "type": GEODIFF_OPERATION_NAMES[entry.operation],
+                    "changes": changes,
+                }
+            )
+    except pygeodiff.GeoDiffLibError as e:
+        raise DbSyncError("geodiff failed!\n" + str(["read_changeset", changeset]) + "\n" + str(e))
+    return details
 
 
 def _geodiff_list_changes_summary(
@@ -339,24 +627,21 @@ def _geodiff_list_changes_summary(
     """Returns a list with changeset summary:
     [ { 'table': 'foo', 'insert': 1, 'update': 2, 'delete': 3 }, ... ]
     """
-    tmp_dir = tempfile.gettempdir()
     tmp_output = os.path.join(
-        tmp_dir,
-        "dbsync-changeset-summary",
+        TMP_DIR,
+        os.path.basename(changeset) + "-summary",
     )
-    if os.path.exists(tmp_output):
-        os.remove(tmp_output)
-    _run_geodiff(
-        [
-            config.geodiff_exe,
-            "as-summary",
+    try:
+        _call_geodiff(
+            "list_changes_summary",
+            None,
             changeset,
             tmp_output,
-        ]
-    )
-    with open(tmp_output) as f:
-        out = json.load(f)
-    os.remove(tmp_output)
+        )
+        with open(tmp_output, "rb") as f:
+            out = _json_loads(f.read())
+    finally:
+        _silent_unlink(tmp_output)
     return out["geodiff_summary"]
 
 
@@ -369,38 +654,16 @@ def _geodiff_make_copy(
     dst,
     ignored_tables,
 ):
-    if ignored_tables:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "copy",
-                "--driver-1",
-                src_driver,
-                src_conn_info,
-                "--driver-2",
-                dst_driver,
-                dst_conn_info,
-                "--skip-tables",
-                _tables_list_to_string(ignored_tables),
-                src,
-                dst,
-            ]
-        )
-    else:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "copy",
-                "--driver-1",
-                src_driver,
-                src_conn_info,
-                "--driver-2",
-                dst_driver,
-                dst_conn_info,
-                src,
-                dst,
-            ]
-        )
+    _call_geodiff(
+        "make_copy",
+        ignored_tables,
+        src_driver,
+        src_conn_info,
+        src,
+        dst_driver,
+        dst_conn_info,
+        dst,
+    )
 
 
 def _geodiff_create_changeset_dr(
@@ -413,40 +676,17 @@ def _geodiff_create_changeset_dr(
     changeset,
     ignored_tables,
 ):
-    if ignored_tables:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "diff",
-                "--driver-1",
-                src_driver,
-                src_conn_info,
-                "--driver-2",
-                dst_driver,
-                dst_conn_info,
-                "--skip-tables",
-                _tables_list_to_string(ignored_tables),
-                src,
-                dst,
-                changeset,
-            ]
-        )
-    else:
-        _run_geodiff(
-            [
-                config.geodiff_exe,
-                "diff",
-                "--driver-1",
-                src_driver,
-                src_conn_info,
-                "--driver-2",
-                dst_driver,
-                dst_conn_info,
-                src,
-                dst,
-                changeset,
-            ]
-        )
+    _call_geodiff(
+        "create_changeset_dr",
+        ignored_tables,
+        src_driver,
+        src_conn_info,
+        src,
+        dst_driver,
+        dst_conn_info,
+        dst,
+        changeset,
+    )
 
 
 def _compare_datasets(
@@ -460,31 +700,32 @@ def _compare_datasets(
     summary_only=True,
 ):
     """Compare content of two datasets (from various drivers) and return geodiff JSON summary of changes"""
-    tmp_dir = tempfile.gettempdir()
-    tmp_changeset = os.path.join(
-        tmp_dir,
-        "".join(
-            random.choices(
-                string.ascii_letters,
-                k=8,
-            )
-        ),
-    )
+    # create a unique temporary file (geodiff simply overwrites it)
+    fd, tmp_changeset = tempfile.mkstemp(prefix="dbsync-cmp-", dir=TMP_DIR)
+    os.close(fd)
+    try:
+        _geodiff_create_changeset_dr(
+            src_driver,
+            src_conn_info,
+            src,
+            dst_driver,
+            dst_conn_info,
+            dst,
+            tmp_changeset,
+            ignored_tables,
+        )
+        if not _geodiff_has_changes(tmp_changeset):
+            return []
+        if summary_only:
+            return _geodiff_list_changes_summary(tmp_changeset)
+        else:
+            return _geodiff_list_changes_details(tmp_changeset)
+    finally:
+        _silent_unlink(tmp_changeset)
 
-    _geodiff_create_changeset_dr(
-        src_driver,
-        src_conn_info,
-        src,
-        dst_driver,
-        dst_conn_info,
-        dst,
-        tmp_changeset,
-        ignored_tables,
-    )
-    if summary_only:
-        return _geodiff_list_changes_summary(tmp_changeset)
-    else:
-        return _geodiff_list_changes_details(tmp_changeset)
+
+# Lock used by _print_changes_summary() function below
+print_lock = threading.Lock()
 
 
 def _print_changes_summary(
@@ -492,9 +733,9 @@ def _print_changes_summary(
     label=None,
 ):
     """Takes a geodiff JSON summary of changes and prints them"""
-    print("Changes:" if label is None else label)
+    lines = ["Changes:" if label is None else label]
     for item in summary:
-        print(
+        lines.append(
             "{:20} {:4} {:4} {:4}".format(
                 item["table"],
                 item["insert"],
@@ -502,6 +743,9 @@ def _print_changes_summary(
                 item["delete"],
             )
         )
+    # print all at once so that output from projects processed in parallel does not get mixed up
+    with print_lock:
+        print("\n".join(lines))
 
 
 def _print_mergin_changes(
@@ -533,13 +777,61 @@ def _get_mergin_project(work_path) -> MerginProject:
     (Safer because we are having a cycle of refs between GeoDiff and MerginProject objects
     related to logging - and untangling those would need some extra calls when we are done
     with MerginProject. But since we use the object all the time, it's better to cache it anyway.)
+    Project metadata are only read once - use _invalidate_mergin_project_metadata() when they change.
     """
     if work_path not in cached_mergin_project_objects:
         cached_mergin_project_objects[work_path] = MerginProject(work_path)
-    cached_mergin_project_objects[work_path]._read_metadata()
     return cached_mergin_project_objects[work_path]
 
 
+def _invalidate_mergin_project_metadata(work_path) -> None:
+    """
+    Marks metadata of a cached MerginProject object as outdated, so that they get loaded again on next use.
+    Needs to be called whenever Mergin Maps client modifies the project directory (pull, push, download).
+    """
+    if work_path in cached_mergin_project_objects:
+        # MerginProject lazily loads metadata from JSON when they are not available
+        cached_mergin_project_objects[work_path]._metadata = None
+
+
+# Dictionary used by _get_project_paths() function below.
+# key = (working dir, Mergin Maps project, sync file), value = (project name, work dir, path to the GeoPackage)
+cached_project_paths = {}
+
+
+def _get_project_paths(conn_cfg) -> tuple:
+    """
+    Returns project name, path to the local project directory and path to the synchronized GeoPackage
+    for the given connection. The paths only depend on the configuration, so they are resolved just once.
+    """
+    key = (config.working_dir, conn_cfg.mergin_project, conn_cfg.sync_file)
+    if key not in cached_project_paths:
+        project_name = conn_cfg.mergin_project.split("/")[1]
+        work_dir = os.path.join(
+            config.working_dir,
+            project_name,
+        )
+        gpkg_full_path = os.path.join(
+            work_dir,
+            conn_cfg.sync_file,
+        )
+        cached_project_paths[key] = (project_name, work_dir, gpkg_full_path)
+    return cached_project_paths[key]
+
+
+def _normalize_project_path(path) -> str:
+    """Returns path of a file within Mergin Maps project in the form used in project metadata"""
+    return pathlib.PurePosixPath(path.replace("\\", "/")).as_posix()
+
+
+def _get_project_file_checksum(mp: MerginProject, path):
+    """Returns checksum of a file from project metadata (None if the file is not in the project)"""
+    for file in mp.files():
+        if _normalize_project_path(file["path"]) == path:
+            return file["checksum"]
+    return None
+
+
 def _get_project_version(work_path) -> str:
     """Returns the current version of the project"""
     mp = _get_mergin_project(work_path)
@@ -558,6 +850,18 @@ def _get_project_id(mp: MerginProject):
     return project_id
 
 
+# Dictionary used by _get_comment_statement() function below.
+# key = schema name, value = composed COMMENT ON SCHEMA statement
+cached_comment_statements = {}
+
+
+def _get_comment_statement(schema) -> sql.Composed:
+    """Returns a (cached) statement that sets comment of the given schema"""
+    if schema not in cached_comment_statements:
+        cached_comment_statements[schema] = sql.SQL("COMMENT ON SCHEMA {} IS %s").format(sql.Identifier(schema))
+    return cached_comment_statements[schema]
+
+
 def _set_db_project_comment(
     conn,
     schema,
@@ -577,26 +881,26 @@ def _set_db_project_comment(
         comment["project_id"] = project_id
     if error:
         comment["error"] = error
-    cur = conn.cursor()
-    query = sql.SQL("COMMENT ON SCHEMA {} IS %s").format(sql.Identifier(schema))
-    cur.execute(
-        query.as_string(conn),
-        (json.dumps(comment),),
-    )
+    with conn.cursor() as cur:
+        cur.execute(
+            _get_comment_statement(schema),
+            (_json_dumps(comment),),
+        )
     conn.commit()
 
 
 def _get_db_project_comment(conn, schema):
     """Get Mergin Maps project name and its current version in db schema"""
-    cur = conn.cursor()
     schema = _add_quotes_to_schema_name(schema)
-    cur.execute(
-        "SELECT obj_description(%s::regnamespace, 'pg_namespace')",
-        (schema,),
-    )
-    res = cur.fetchone()[0]
+    with conn.cursor() as cur:
+        _execute_prepared_statement(
+            cur,
+            "dbsync_schema_comment",
+            (schema,),
+        )
+        res = cur.fetchone()[0]
     try:
-        comment = json.loads(res) if res else None
+        comment = _json_loads(res) if res else None
     except (
         TypeError,
         json.decoder.JSONDecodeError,
@@ -620,6 +924,8 @@ def _redownload_project(conn_cfg, mc, work_dir, db_proj_info):
         )
     except ClientError as e:
         raise DbSyncError("Mergin Maps client error: " + str(e))
+    finally:
+        _invalidate_mergin_project_metadata(work_dir)
 
 
 def _validate_local_project_id(
@@ -727,15 +1033,7 @@ def pull(conn_cfg, mc):
     logging.debug(f"Processing Mergin Maps project '{conn_cfg.mergin_project}'")
     ignored_tables = get_ignored_tables(conn_cfg)
 
-    project_name = conn_cfg.mergin_project.split("/")[1]
-    work_dir = os.path.join(
-        config.working_dir,
-        project_name,
-    )
-    gpkg_full_path = os.path.join(
-        work_dir,
-        conn_cfg.sync_file,
-    )
+    project_name, work_dir, gpkg_full_path = _get_project_paths(conn_cfg)
 
     _check_has_working_dir(work_dir)
     _check_has_sync_file(gpkg_full_path)
@@ -745,18 +1043,26 @@ def pull(conn_cfg, mc):
     if mp.geodiff is None:
         raise DbSyncError("Mergin Maps client installation problem: geodiff not available")
 
-    # Make sure that local project ID (if available) is the same as on  the server
-    _validate_local_project_id(mp, mc)
-
     local_version = mp.version()
+    project_path = mp.project_full_name()
 
     try:
-        projects = mc.get_projects_by_names([mp.project_full_name()])
-        server_version = projects[mp.project_full_name()]["version"]
+        server_info = mc.project_info(
+            project_path,
+            since=local_version,
+        )
+        server_version = server_info["version"]
     except ClientError as e:
         # this could be e.g. DNS error
         raise DbSyncError("Mergin Maps client error: " + str(e))
 
+    # Make sure that local project ID (if available) is the same as on  the server
+    _validate_local_project_id(
+        mp,
+        mc,
+        server_info,
+    )
+
     local_changes = mp.get_push_changes()
     if any(local_changes.values()):
         local_changes = revert_local_changes(
@@ -779,93 +1085,146 @@ def pull(conn_cfg, mc):
     )
     gpkg_basefile_old = gpkg_basefile + "-old"
 
-    # make a copy of the basefile in the current version (base) - because after pull it will be set to "their"
-    shutil.copy(
-        gpkg_basefile,
-        gpkg_basefile_old,
+    # the new version may only contain changes of other files - then there is nothing to apply to the database
+    status_pull = mp.get_pull_changes(server_info["files"])
+    sync_file_path = _normalize_project_path(conn_cfg.sync_file)
+    sync_file_expected_change = any(
+        _normalize_project_path(item["path"]) == sync_file_path
+        for item in chain(status_pull["updated"], status_pull["removed"])
     )
+    sync_file_checksum = _get_project_file_checksum(mp, sync_file_path)
+
+    if sync_file_expected_change:
+        # make a copy of the basefile in the current version (base) - because after pull it will be set to "their"
+        # (a hard link would not do - the basefile gets patched in place during pull)
+        shutil.copy(
+            gpkg_basefile,
+            gpkg_basefile_old,
+        )
 
-    tmp_dir = tempfile.gettempdir()
     tmp_base2our = os.path.join(
-        tmp_dir,
+        TMP_DIR,
         f"{project_name}-dbsync-pull-base2our",
     )
     tmp_base2their = os.path.join(
-        tmp_dir,
+        TMP_DIR,
         f"{project_name}-dbsync-pull-base2their",
     )
-
-    # find out our local changes in the database (base2our)
-    _geodiff_create_changeset(
-        conn_cfg.driver,
-        conn_cfg.conn_info,
-        conn_cfg.base,
-        conn_cfg.modified,
-        tmp_base2our,
-        ignored_tables,
+    tmp_conflicts = os.path.join(
+        TMP_DIR,
+        f"{project_name}-dbsync-pull-conflicts",
     )
 
-    needs_rebase = False
-    if os.path.getsize(tmp_base2our) != 0:
-        needs_rebase = True
-        summary = _geodiff_list_changes_summary(tmp_base2our)
-        _print_changes_summary(
-            summary,
-            "DB Changes:",
-        )
-
     try:
         mc.pull_project(work_dir)  # will do rebase as needed
     except ClientError as e:
         # TODO: do we need some cleanup here?
         raise DbSyncError("Mergin Maps client error on pull: " + str(e))
+    finally:
+        _invalidate_mergin_project_metadata(work_dir)
 
-    logging.debug("Pulled new version from Mergin Maps: " + _get_project_version(work_dir))
+    # metadata of the (cached) project object were invalidated above - they get read again just once here
+    version = mp.version()
+    logging.debug("Pulled new version from Mergin Maps: " + version)
 
-    # simple case when there are no pending local changes - just apply whatever changes are coming
-    _geodiff_create_changeset(
-        "sqlite",
-        "",
-        gpkg_basefile_old,
-        gpkg_basefile,
-        tmp_base2their,
-        ignored_tables,
+    # the client may have pulled a newer version than the one we have checked above - so we need
+    # to make sure whether the GeoPackage has changed by looking at the metadata after the pull
+    sync_file_changed = sync_file_expected_change or (
+        _get_project_file_checksum(mp, sync_file_path) != sync_file_checksum
     )
 
-    # summarize changes
-    summary = _geodiff_list_changes_summary(tmp_base2their)
-    _print_changes_summary(
-        summary,
-        "Mergin Maps Changes:",
-    )
+    with _temporary_files(tmp_base2our, tmp_base2their, tmp_conflicts):
+        if not sync_file_changed:
+            # local changes in the database stay untouched - no need to diff the whole schema
+            logging.debug("No changes of the synchronized GeoPackage on Mergin Maps.")
+        else:
+            # find out our local changes in the database (base2our)
+            _geodiff_create_changeset(
+                conn_cfg.driver,
+                conn_cfg.conn_info,
+                conn_cfg.base,
+                conn_cfg.modified,
+                tmp_base2our,
+                ignored_tables,
+            )
 
-    if not needs_rebase:
-        logging.debug("Applying new version [no rebase]")
-        _geodiff_apply_changeset(conn_cfg.driver, conn_cfg.conn_info, conn_cfg.base, tmp_base2their, ignored_tables)
-        _geodiff_apply_changeset(conn_cfg.driver, conn_cfg.conn_info, conn_cfg.modified, tmp_base2their, ignored_tables)
-    else:
-        logging.debug("Applying new version [WITH rebase]")
-        tmp_conflicts = os.path.join(tmp_dir, f"{project_name}-dbsync-pull-conflicts")
-        _geodiff_rebase(
-            conn_cfg.driver,
-            conn_cfg.conn_info,
+            needs_rebase = False
+            if os.path.getsize(tmp_base2our) != 0:
+                needs_rebase = True
+                summary = _geodiff_list_changes_summary(tmp_base2our)
+                _print_changes_summary(
+                    summary,
+                    f"DB Changes ({conn_cfg.mergin_project}):",
+                )
+
+            if sync_file_expected_change:
+                _geodiff_create_changeset(
+                    "sqlite",
+                    "",
+                    gpkg_basefile_old,
+                    gpkg_basefile,
+                    tmp_base2their,
+                    ignored_tables,
+                )
+                os.remove(gpkg_basefile_old)
+            else:
+                # we have no copy of the previous basefile - but the base schema holds the same data
+                logging.debug(
+                    f"Version {version} changes the GeoPackage unexpectedly, comparing it with the base schema"
+                )
+                _geodiff_create_changeset_dr(
+                    conn_cfg.driver,
+                    conn_cfg.conn_info,
+                    conn_cfg.base,
+                    "sqlite",
+                    "",
+                    gpkg_basefile,
+                    tmp_base2their,
+                    ignored_tables,
+                )
+
+            if os.path.getsize(tmp_base2their) == 0:
+                # nothing to summarize or apply
+                logging.debug("No changes of the synchronized GeoPackage data on Mergin Maps.")
+            else:
+                # summarize changes
+                summary = _geodiff_list_changes_summary(tmp_base2their)
+                _print_changes_summary(
+                    summary,
+                    f"Mergin Maps Changes ({conn_cfg.mergin_project}):",
+                )
+
+                if not needs_rebase:
+                    logging.debug("Applying new version [no rebase]")
+                    _geodiff_apply_changeset_to_many(
+                        conn_cfg.driver,
+                        conn_cfg.conn_info,
+                        [conn_cfg.base, conn_cfg.modified],
+                        tmp_base2their,
+                        ignored_tables,
+                    )
+                else:
+                    logging.debug("Applying new version [WITH rebase]")
+                    _geodiff_rebase(
+                        conn_cfg.driver,
+                        conn_cfg.conn_info,
+                        conn_cfg.base,
+                        conn_cfg.modified,
+                        tmp_base2their,
+                        tmp_conflicts,
+                        ignored_tables,
+                    )
+                    _geodiff_apply_changeset(
+                        conn_cfg.driver, conn_cfg.conn_info, conn_cfg.base, tmp_base2their, ignored_tables
+                    )
+
+    with _db_connection(conn_cfg.conn_info) as conn:
+        _set_db_project_comment(
+            conn,
             conn_cfg.base,
-            conn_cfg.modified,
-            tmp_base2their,
-            tmp_conflicts,
-            ignored_tables,
+            conn_cfg.mergin_project,
+            version,
         )
-        _geodiff_apply_changeset(conn_cfg.driver, conn_cfg.conn_info, conn_cfg.base, tmp_base2their, ignored_tables)
-
-    os.remove(gpkg_basefile_old)
-    conn = psycopg2.connect(conn_cfg.conn_info)
-    version = _get_project_version(work_dir)
-    _set_db_project_comment(
-        conn,
-        conn_cfg.base,
-        conn_cfg.mergin_project,
-        version,
-    )
 
 
 def status(conn_cfg, mc):
@@ -874,16 +1233,7 @@ def status(conn_cfg, mc):
     logging.debug(f"Processing Mergin Maps project '{conn_cfg.mergin_project}'")
     ignored_tables = get_ignored_tables(conn_cfg)
 
-    project_name = conn_cfg.mergin_project.split("/")[1]
-
-    work_dir = os.path.join(
-        config.working_dir,
-        project_name,
-    )
-    gpkg_full_path = os.path.join(
-        work_dir,
-        conn_cfg.sync_file,
-    )
+    project_name, work_dir, gpkg_full_path = _get_project_paths(conn_cfg)
 
     _check_has_working_dir(work_dir)
     _check_has_sync_file(gpkg_full_path)
@@ -895,76 +1245,80 @@ def status(conn_cfg, mc):
         raise DbSyncError("Mergin Maps client installation problem: geodiff not available")
     project_path = mp.project_full_name()
     local_version = mp.version()
-    logging.debug("Checking status...")
-    try:
-        server_info = mc.project_info(
-            project_path,
-            since=local_version,
+
+    with _db_connection(conn_cfg.conn_info) as conn:
+        schemas_exist = _check_schemas_exist(
+            conn,
+            [conn_cfg.base, conn_cfg.modified],
         )
-    except ClientError as e:
-        raise DbSyncError("Mergin Maps client error: " + str(e))
+    if not schemas_exist[conn_cfg.base]:
+        raise DbSyncError("The base schema does not exist: " + conn_cfg.base)
+    if not schemas_exist[conn_cfg.modified]:
+        raise DbSyncError("The 'modified' schema does not exist: " + conn_cfg.modified)
 
-    # Make sure that local project ID (if available) is the same as on  the server
-    _validate_local_project_id(
-        mp,
-        mc,
-        server_info,
+    tmp_changeset_file = os.path.join(
+        TMP_DIR,
+        f"{project_name}-dbsync-status-base2our",
     )
 
-    status_push = mp.get_push_changes()
-    if status_push["added"] or status_push["updated"] or status_push["removed"]:
-        raise DbSyncError("Pending changes in the local directory - that should never happen! " + str(status_push))
+    with _temporary_files(tmp_changeset_file):
+        logging.debug("Checking status...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            # get changes in the DB - this does not depend on the server, so it runs while we wait for Mergin Maps
+            db_changes_future = executor.submit(
+                _geodiff_create_changeset,
+                conn_cfg.driver,
+                conn_cfg.conn_info,
+                conn_cfg.base,
+                conn_cfg.modified,
+                tmp_changeset_file,
+                ignored_tables,
+            )
 
-    logging.debug("Working directory " + work_dir)
-    logging.debug("Mergin Maps project " + project_path + " at local version " + local_version)
-    logging.debug("")
+            try:
+                server_info = mc.project_info(
+                    project_path,
+                    since=local_version,
+                )
+            except ClientError as e:
+                raise DbSyncError("Mergin Maps client error: " + str(e))
 
-    logging.debug("Server is at version " + server_info["version"])
-    status_pull = mp.get_pull_changes(server_info["files"])
-    if status_pull["added"] or status_pull["updated"] or status_pull["removed"]:
-        logging.debug("There are pending changes on server:")
-        _print_mergin_changes(status_pull)
-    else:
-        logging.debug("No pending changes on server.")
+            # Make sure that local project ID (if available) is the same as on  the server
+            _validate_local_project_id(
+                mp,
+                mc,
+                server_info,
+            )
 
-    logging.debug("")
-    conn = psycopg2.connect(conn_cfg.conn_info)
+            status_push = mp.get_push_changes()
+            if status_push["added"] or status_push["updated"] or status_push["removed"]:
+                raise DbSyncError(
+                    "Pending changes in the local directory - that should never happen! " + str(status_push)
+                )
 
-    if not _check_schema_exists(
-        conn,
-        conn_cfg.base,
-    ):
-        raise DbSyncError("The base schema does not exist: " + conn_cfg.base)
-    if not _check_schema_exists(
-        conn,
-        conn_cfg.modified,
-    ):
-        raise DbSyncError("The 'modified' schema does not exist: " + conn_cfg.modified)
+            logging.debug("Working directory " + work_dir)
+            logging.debug("Mergin Maps project " + project_path + " at local version " + local_version)
+            logging.debug("")
 
-    # get changes in the DB
-    tmp_dir = tempfile.gettempdir()
-    tmp_changeset_file = os.path.join(
-        tmp_dir,
-        f"{project_name}-dbsync-status-base2our",
-    )
-    if os.path.exists(tmp_changeset_file):
-        os.remove(tmp_changeset_file)
-    _geodiff_create_changeset(
-        conn_cfg.driver,
-        conn_cfg.conn_info,
-        conn_cfg.base,
-        conn_cfg.modified,
-        tmp_changeset_file,
-        ignored_tables,
-    )
+            logging.debug("Server is at version " + server_info["version"] + " of " + project_path)
+            status_pull = mp.get_pull_changes(server_info["files"])
+            if status_pull["added"] or status_pull["updated"] or status_pull["removed"]:
+                logging.debug("There are pending changes on server in " + project_path + ":")
+                _print_mergin_changes(status_pull)
+            else:
+                logging.debug("No pending changes on server in " + project_path + ".")
 
-    if os.path.getsize(tmp_changeset_file) == 0:
-        logging.debug("No changes in the database.")
-    else:
-        logging.debug("There are changes in DB")
-        # summarize changes
-        summary = _geodiff_list_changes_summary(tmp_changeset_file)
-        _print_changes_summary(summary)
+            logging.debug("")
+            # re-raises error from geodiff (if any)
+            db_changes_future.result()
+
+        if os.path.getsize(tmp_changeset_file) == 0:
+            logging.debug("No changes in the database of " + conn_cfg.mergin_project + ".")
+        else:
+            logging.debug("There are changes in DB of " + conn_cfg.mergin_project)
+            # summarize changes
+            summary = _geodiff_list_changes_summary(tmp_changeset_file)
+            _print_changes_summary(summary, f"Changes ({conn_cfg.mergin_project}):")
 
 
 def push(conn_cfg, mc):
@@ -973,24 +1327,12 @@ def push(conn_cfg, mc):
     logging.debug(f"Processing Mergin Maps project '{conn_cfg.mergin_project}'")
     ignored_tables = get_ignored_tables(conn_cfg)
 
-    project_name = conn_cfg.mergin_project.split("/")[1]
+    project_name, work_dir, gpkg_full_path = _get_project_paths(conn_cfg)
 
-    tmp_dir = tempfile.gettempdir()
     tmp_changeset_file = os.path.join(
-        tmp_dir,
+        TMP_DIR,
         f"{project_name}-dbsync-push-base2our",
     )
-    if os.path.exists(tmp_changeset_file):
-        os.remove(tmp_changeset_file)
-
-    work_dir = os.path.join(
-        config.working_dir,
-        project_name,
-    )
-    gpkg_full_path = os.path.join(
-        work_dir,
-        conn_cfg.sync_file,
-    )
     _check_has_working_dir(work_dir)
     _check_has_sync_file(gpkg_full_path)
 
@@ -1003,10 +1345,11 @@ def push(conn_cfg, mc):
     _validate_local_project_id(mp, mc)
 
     local_version = mp.version()
+    project_path = mp.project_full_name()
 
     try:
-        projects = mc.get_projects_by_names([mp.project_full_name()])
-        server_version = projects[mp.project_full_name()]["version"]
+        projects = mc.get_projects_by_names([project_path])
+        server_version = projects[project_path]["version"]
     except ClientError as e:
         # this could be e.g. DNS error
         raise DbSyncError("Mergin Maps client error: " + str(e))
@@ -1021,55 +1364,80 @@ def push(conn_cfg, mc):
     if server_version != local_version:
         raise DbSyncError("There are pending changes on server - need to pull them first.")
 
-    conn = psycopg2.connect(conn_cfg.conn_info)
-
-    if not _check_schema_exists(
-        conn,
-        conn_cfg.base,
-    ):
+    with _db_connection(conn_cfg.conn_info) as conn:
+        schemas_exist = _check_schemas_exist(
+            conn,
+            [conn_cfg.base, conn_cfg.modified],
+        )
+    if not schemas_exist[conn_cfg.base]:
         raise DbSyncError("The base schema does not exist: " + conn_cfg.base)
-    if not _check_schema_exists(
-        conn,
-        conn_cfg.modified,
-    ):
+    if not schemas_exist[conn_cfg.modified]:
         raise DbSyncError("The 'modified' schema does not exist: " + conn_cfg.modified)
 
-    # get changes in the DB
-    _geodiff_create_changeset(
-        conn_cfg.driver,
-        conn_cfg.conn_info,
-        conn_cfg.base,
-        conn_cfg.modified,
-        tmp_changeset_file,
-        ignored_tables,
-    )
+    with _temporary_files(tmp_changeset_file):
+        # get changes in the DB
+        _geodiff_create_changeset(
+            conn_cfg.driver,
+            conn_cfg.conn_info,
+            conn_cfg.base,
+            conn_cfg.modified,
+            tmp_changeset_file,
+            ignored_tables,
+        )
 
-    if os.path.getsize(tmp_changeset_file) == 0:
-        logging.debug("No changes in the database.")
-        return
+        if os.path.getsize(tmp_changeset_file) == 0:
+            logging.debug("No changes in the database.")
+            return
 
-    # summarize changes
-    summary = _geodiff_list_changes_summary(tmp_changeset_file)
-    _print_changes_summary(summary)
+        # summarize changes
+        summary = _geodiff_list_changes_summary(tmp_changeset_file)
+        _print_changes_summary(summary, f"Changes ({conn_cfg.mergin_project}):")
 
-    # write changes to the local geopackage
-    logging.debug("Writing DB changes to working dir...")
-    _geodiff_apply_changeset("sqlite", "", gpkg_full_path, tmp_changeset_file, ignored_tables)
+        # write changes to the local geopackage
+        logging.debug("Writing DB changes to working dir...")
+        _geodiff_apply_changeset("sqlite", "", gpkg_full_path, tmp_changeset_file, ignored_tables)
 
-    # write to the server
-    try:
-        mc.push_project(work_dir)
-    except ClientError as e:
-        # TODO: should we do some cleanup here? (undo changes in the local geopackage?)
-        raise DbSyncError("Mergin Maps client error on push: " + str(e))
+        # write to the server
+        try:
+            mc.push_project(work_dir)
+        except ClientError as e:
+            # TODO: should we do some cleanup here? (undo changes in the local geopackage?)
+            raise DbSyncError("Mergin Maps client error on push: " + str(e))
+        finally:
+            _invalidate_mergin_project_metadata(work_dir)
 
-    version = _get_project_version(work_dir)
-    logging.debug("Pushed new version to Mergin Maps: " + version)
+        version = mp.version()
+        logging.debug("Pushed new version to Mergin Maps: " + version)
 
-    # update base schema in the DB
-    logging.debug("Updating DB base schema...")
-    _geodiff_apply_changeset(conn_cfg.driver, conn_cfg.conn_info, conn_cfg.base, tmp_changeset_file, ignored_tables)
-    _set_db_project_comment(conn, conn_cfg.base, conn_cfg.mergin_project, version)
+        # update base schema in the DB
+        logging.debug("Updating DB base schema...")
+        _geodiff_apply_changeset(conn_cfg.driver, conn_cfg.conn_info, conn_cfg.base, tmp_changeset_file, ignored_tables)
+        with _db_connection(conn_cfg.conn_info) as conn:
+            _set_db_project_comment(conn, conn_cfg.base, conn_cfg.mergin_project, version)
+
+
+def _log_gpkg_base_changes_details(
+    message,
+    conn_cfg,
+    gpkg_full_path,
+    ignored_tables,
+):
+    """Logs detailed differences between the GeoPackage and the 'base' schema (only if `log_changeset_details`
+    is enabled in the config, as getting the details is expensive for larger datasets)"""
+    if not config.get("log_changeset_details", False):
+        return
+    changes_gpkg_base = _compare_datasets(
+        "sqlite",
+        "",
+        gpkg_full_path,
+        conn_cfg.driver,
+        conn_cfg.conn_info,
+        conn_cfg.base,
+        ignored_tables,
+        summary_only=False,
+    )
+    changes = json.dumps(changes_gpkg_base, indent=2)
+    logging.debug(f"{message}:\n {changes}")
 
 
 def init(
@@ -1082,45 +1450,36 @@ def init(
     logging.debug(f"Processing Mergin Maps project '{conn_cfg.mergin_project}'")
     ignored_tables = get_ignored_tables(conn_cfg)
 
-    project_name = conn_cfg.mergin_project.split("/")[1]
+    project_name, work_dir, gpkg_full_path = _get_project_paths(conn_cfg)
 
     # let's start with various environment checks to make sure
     # the environment is set up correctly before doing any work
     logging.debug("Connecting to the database...")
-    try:
-        conn = psycopg2.connect(conn_cfg.conn_info)
-    except psycopg2.Error as e:
-        raise DbSyncError("Unable to connect to the database: " + str(e))
+    with _db_connection(conn_cfg.conn_info) as conn:
+        if conn_cfg.driver.lower() == "postgres":
+            if not _check_postgis_available(conn):
+                if not _try_install_postgis(conn):
+                    raise DbSyncError("Cannot find or activate `postgis` extension. You may need to install it.")
 
-    if conn_cfg.driver.lower() == "postgres":
-        if not _check_postgis_available(conn):
-            if not _try_install_postgis(conn):
-                raise DbSyncError("Cannot find or activate `postgis` extension. You may need to install it.")
+        schemas_exist = _check_schemas_exist(
+            conn,
+            [conn_cfg.base, conn_cfg.modified],
+        )
+        base_schema_exists = schemas_exist[conn_cfg.base]
+        modified_schema_exists = schemas_exist[conn_cfg.modified]
+        if modified_schema_exists and base_schema_exists:
+            db_proj_info = _get_db_project_comment(
+                conn,
+                conn_cfg.base,
+            )
 
-    base_schema_exists = _check_schema_exists(
-        conn,
-        conn_cfg.base,
-    )
-    modified_schema_exists = _check_schema_exists(
-        conn,
-        conn_cfg.modified,
-    )
+    # the working directory may have been modified or removed by someone else since we have last used it,
+    # so project metadata cached from earlier runs can not be trusted here
+    _invalidate_mergin_project_metadata(work_dir)
 
-    work_dir = os.path.join(
-        config.working_dir,
-        project_name,
-    )
-    gpkg_full_path = os.path.join(
-        work_dir,
-        conn_cfg.sync_file,
-    )
     if modified_schema_exists and base_schema_exists:
         logging.debug("Modified and base schemas already exist")
         # this is not a first run of db-sync init
-        db_proj_info = _get_db_project_comment(
-            conn,
-            conn_cfg.base,
-        )
         if not db_proj_info:
             raise DbSyncError(
                 "Base schema exists but missing which project it belongs to. "
@@ -1128,18 +1487,12 @@ def init(
                 f"{FORCE_INIT_MESSAGE}"
             )
         if "error" in db_proj_info:
-            changes_gpkg_base = _compare_datasets(
-                "sqlite",
-                "",
+            _log_gpkg_base_changes_details(
+                "Changeset from failed init",
+                conn_cfg,
                 gpkg_full_path,
-                conn_cfg.driver,
-                conn_cfg.conn_info,
-                conn_cfg.base,
                 ignored_tables,
-                summary_only=False,
             )
-            changes = json.dumps(changes_gpkg_base, indent=2)
-            logging.debug(f"Changeset from failed init:\n {changes}")
             raise DbSyncError(db_proj_info["error"])
 
         # make sure working directory contains the same version of project
@@ -1149,6 +1502,7 @@ def init(
                 f"to {work_dir}"
             )
             mc.download_project(conn_cfg.mergin_project, work_dir, db_proj_info["version"])
+            _invalidate_mergin_project_metadata(work_dir)
         else:
             # Get project ID from DB if available
             try:
@@ -1179,14 +1533,15 @@ def init(
         if not os.path.exists(work_dir):
             logging.debug("Downloading latest Mergin Maps project " + conn_cfg.mergin_project + " to " + work_dir)
             mc.download_project(conn_cfg.mergin_project, work_dir)
+            _invalidate_mergin_project_metadata(work_dir)
         else:
             local_version = _get_project_version(work_dir)
             logging.debug(f"Working directory {work_dir} already exists, with project version {local_version}")
 
     # make sure we have working directory now
     _check_has_working_dir(work_dir)
-    local_version = _get_project_version(work_dir)
     mp = _get_mergin_project(work_dir)
+    local_version = mp.version()
     # Make sure that local project ID (if available) is the same as on  the server
     _validate_local_project_id(mp, mc)
 
@@ -1294,12 +1649,16 @@ def init(
                 conn_cfg.conn_info,
                 conn_cfg.base,
                 ignored_tables,
-                summary_only=False,
+                summary_only=True,
             )
             # mark project version into db schema
             if len(changes_gpkg_base):
-                changes = json.dumps(changes_gpkg_base, indent=2)
-                logging.debug(f"Changeset after internal copy (should be empty):\n {changes}")
+                _log_gpkg_base_changes_details(
+                    "Changeset after internal copy (should be empty)",
+                    conn_cfg,
+                    gpkg_full_path,
+                    ignored_tables,
+                )
                 raise DbSyncError(
                     "Initialization of db-sync failed due to a bug in geodiff.\n "
                     "Please report this problem to mergin-db-sync developers"
@@ -1308,16 +1667,18 @@ def init(
             logging.debug(
                 f"Cleaning up after a failed DB sync init - dropping schemas {conn_cfg.base} and {conn_cfg.modified}."
             )
-            _drop_schema(conn, conn_cfg.base)
-            _drop_schema(conn, conn_cfg.modified)
+            with _db_connection(conn_cfg.conn_info) as conn:
+                _drop_schema(conn, conn_cfg.base)
+                _drop_schema(conn, conn_cfg.modified)
             raise
 
-        _set_db_project_comment(
-            conn,
-            conn_cfg.base,
-            conn_cfg.mergin_project,
-            local_version,
-        )
+        with _db_connection(conn_cfg.conn_info) as conn:
+            _set_db_project_comment(
+                conn,
+                conn_cfg.base,
+                conn_cfg.mergin_project,
+                local_version,
+            )
     else:
         if not modified_schema_exists:
             raise DbSyncError(
@@ -1413,31 +1774,38 @@ def init(
                 conn_cfg.conn_info,
                 conn_cfg.base,
                 ignored_tables,
-                summary_only=False,
+                summary_only=True,
             )
             if len(changes_gpkg_base):
-                changes = json.dumps(changes_gpkg_base, indent=2)
-                logging.debug(f"Changeset after internal copy (should be empty):\n {changes}")
+                _log_gpkg_base_changes_details(
+                    "Changeset after internal copy (should be empty)",
+                    conn_cfg,
+                    gpkg_full_path,
+                    ignored_tables,
+                )
                 raise DbSyncError(
                     "Initialization of db-sync failed due to a bug in geodiff.\n "
                     "Please report this problem to mergin-db-sync developers"
                 )
         except DbSyncError:
             logging.debug(f"Cleaning up after a failed DB sync init - dropping schema {conn_cfg.base}.")
-            _drop_schema(conn, conn_cfg.base)
+            with _db_connection(conn_cfg.conn_info) as conn:
+                _drop_schema(conn, conn_cfg.base)
             raise
 
         # upload gpkg to Mergin Maps (client takes care of storing metadata)
         mc.push_project(work_dir)
+        _invalidate_mergin_project_metadata(work_dir)
 
         # mark project version into db schema
-        version = _get_project_version(work_dir)
-        _set_db_project_comment(
-            conn,
-            conn_cfg.base,
-            conn_cfg.mergin_project,
-            version,
-        )
+        version = mp.version()
+        with _db_connection(conn_cfg.conn_info) as conn:
+            _set_db_project_comment(
+                conn,
+                conn_cfg.base,
+                conn_cfg.mergin_project,
+                version,
+            )
 
 
 def dbsync_init(mc):
@@ -1452,16 +1820,54 @@ def dbsync_init(mc):
     logging.debug("Init done!")
 
 
-def dbsync_pull(mc):
+def _run_for_all_connections(
+    func,
+    mc,
+):
+    """
+    Runs given function (e.g. pull or push) for all connections from the config. Most of the time is spent
+    waiting for Mergin Maps server, the database or geodiff, so different Mergin Maps projects are processed
+    in parallel. Connections using the same project are processed one after another as they share working directory.
+    """
+    connections_by_project = {}
     for conn in config.connections:
-        pull(conn, mc)
+        project_name = _get_project_paths(conn)[0]
+        connections_by_project.setdefault(project_name, []).append(conn)
+    if not connections_by_project:
+        return
+
+    def _run_for_project(connections):
+        for conn in connections:
+            func(conn, mc)
+
+    max_workers = min(MAX_PARALLEL_PROJECTS, len(connections_by_project))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            project_name: executor.submit(_run_for_project, connections)
+            for project_name, connections in connections_by_project.items()
+        }
+
+    # report failures of all projects, not just the first one - which is then re-raised
+    first_error = None
+    for project_name, future in futures.items():
+        error = future.exception()
+        if error is None:
+            continue
+        logging.error(f"Processing of Mergin Maps project '{project_name}' failed: {error}")
+        if first_error is None:
+            first_error = error
+    if first_error is not None:
+        raise first_error
+
+
+def dbsync_pull(mc):
+    _run_for_all_connections(pull, mc)
 
     logging.debug("Pull done!")
 
 
 def dbsync_push(mc):
-    for conn in config.connections:
-        push(conn, mc)
+    _run_for_all_connections(push, mc)
 
     logging.debug("Push done!")
 
@@ -1469,8 +1875,7 @@ def dbsync_push(mc):
 def dbsync_status(
     mc,
 ):
-    for conn in config.connections:
-        status(conn, mc)
+    _run_for_all_connections(status, mc)
 
 
 def clean(conn_cfg, mc):
@@ -1481,6 +1886,8 @@ def clean(conn_cfg, mc):
             shutil.rmtree(config.working_dir)
         except FileNotFoundError as e:
             raise DbSyncError("Unable to remove working directory: " + str(e))
+    for work_path in cached_mergin_project_objects:
+        _invalidate_mergin_project_metadata(work_path)
 
     if from_db:
         temp_folder = pathlib.Path(config.working_dir).parent / "project_to_delete_sync_file"
@@ -1503,25 +1910,21 @@ def clean(conn_cfg, mc):
             if temp_folder.exists():
                 shutil.rmtree(temp_folder)
 
-    try:
-        conn_db = psycopg2.connect(conn_cfg.conn_info)
-    except psycopg2.Error as e:
-        raise DbSyncError("Unable to connect to the database: " + str(e))
-
-    try:
-        _drop_schema(
-            conn_db,
-            conn_cfg.base,
-        )
-
-        if not from_db:
+    with _db_connection(conn_cfg.conn_info) as conn_db:
+        try:
             _drop_schema(
                 conn_db,
-                conn_cfg.modified,
+                conn_cfg.base,
             )
 
-    except psycopg2.Error as e:
-        raise DbSyncError("Unable to drop schema from database: " + str(e))
+            if not from_db:
+                _drop_schema(
+                    conn_db,
+                    conn_cfg.modified,
+                )
+
+        except psycopg2.Error as e:
+            raise DbSyncError("Unable to drop schema from database: " + str(e))
 
 
 def dbsync_clean(
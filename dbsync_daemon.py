@@ -9,10 +9,10 @@ import logging
 import os
 import pathlib
 import platform
+import signal
 import sys
 import time
 
-import dbsync
 from config import ConfigError, config, update_config_path, validate_config
 from log_functions import handle_error_and_exit, setup_logger
 from smtp_functions import send_email
@@ -42,8 +42,14 @@ def pyinstaller_path_fix() -> None:
         pyinstaller_update_path()
 
 
+def exit_on_sigterm(signum, frame) -> None:
+    # raise SystemExit so that cleanup (e.g. removal of temporary files) runs also when stopped by the service manager
+    sys.exit(128 + signum)
+
+
 def main():
     pyinstaller_path_fix()
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
 
     parser = argparse.ArgumentParser(
         prog="dbsync_deamon.py",
@@ -107,12 +113,15 @@ def main():
 
     logging.debug(f"== starting mergin-db-sync daemon == version {__version__} ==")
 
+    # check arguments first - before loading and validating the config, which may take a while
+    if args.force_init and args.skip_init:
+        handle_error_and_exit("Cannot use `--force-init` with `--skip-init` Initialization is required. ")
+
     try:
         update_config_path(args.config_file)
     except IOError as e:
         handle_error_and_exit(e)
 
-    sleep_time = config.as_int("daemon.sleep_time")
     try:
         validate_config(config)
     except ConfigError as e:
@@ -132,8 +141,9 @@ def main():
         send_email("Mergin DB Sync test email.", config)
         sys.exit(0)
 
-    if args.force_init and args.skip_init:
-        handle_error_and_exit("Cannot use `--force-init` with `--skip-init` Initialization is required. ")
+    # imported only now (it loads Mergin Maps client, psycopg2 and geodiff) - so that showing help
+    # or failing on invalid arguments or config does not need to wait for it
+    import dbsync
 
     logging.debug("Logging in to Mergin...")
 
@@ -160,6 +170,8 @@ def main():
             handle_error_and_exit(e)
 
     else:
+        sleep_time = config.as_int("daemon.sleep_time")
+
         if not args.skip_init:
             try:
                 dbsync.dbsync_init(mc)
@@ -24,6 +24,13 @@ TEST_DATA_DIR = os.path.join(
     "test_data",
 )
 
+# settings shared by all configs created by _reset_config()
+BASE_CONFIG = {
+    "MERGIN__USERNAME": API_USER,
+    "MERGIN__PASSWORD": USER_PWD,
+    "MERGIN__URL": SERVER_URL,
+}
+
 
 def _reset_config(project_name: str = "mergin", init_from: str = "gpkg"):
     """helper to reset config settings to ensure valid config"""
@@ -33,9 +40,7 @@ def _reset_config(project_name: str = "mergin", init_from: str = "gpkg"):
 
     config.update(
         {
-            "MERGIN__USERNAME": API_USER,
-            "MERGIN__PASSWORD": USER_PWD,
-            "MERGIN__URL": SERVER_URL,
+            **BASE_CONFIG,
             "init_from": init_from,
             "CONNECTIONS": [
                 {
@@ -306,6 +306,85 @@ def test_basic_pull(
     dbsync_status(mc)
 
 
+def test_pull_other_file_change(
+    mc: MerginClient,
+):
+    """
+    Test pull of a version which only changes files other than the synchronized GeoPackage
+    and of a later version which changes the GeoPackage too
+    """
+    project_name = "test_sync_pull_other_file"
+    db_schema_main = project_name + "_main"
+    db_schema_base = project_name + "_base"
+
+    source_gpkg_path = os.path.join(
+        TEST_DATA_DIR,
+        "base.gpkg",
+    )
+    project_dir = os.path.join(
+        TMP_DIR,
+        project_name + "_work",
+    )  # working directory
+    dbsync_project_dir = os.path.join(
+        TMP_DIR,
+        project_name + "_dbsync",
+        project_name,
+    )  # project location within dbsync working dir
+
+    init_sync_from_geopackage(
+        mc,
+        project_name,
+        source_gpkg_path,
+    )
+
+    conn = psycopg2.connect(DB_CONNINFO)
+
+    # add a file which is not synchronized with the database and push
+    with open(os.path.join(project_dir, "notes.txt"), "w") as f:
+        f.write("some notes")
+    mc.push_project(project_dir)
+
+    # pull - nothing to apply to the database, but the version needs to be updated
+    dbsync_pull(mc)
+
+    assert os.path.exists(os.path.join(dbsync_project_dir, "notes.txt"))
+    assert not os.path.exists(os.path.join(dbsync_project_dir, ".mergin", "test_sync.gpkg-old"))
+    cur = conn.cursor()
+    cur.execute(sql.SQL("SELECT count(*) from {}.simple").format(sql.Identifier(db_schema_main)))
+    assert cur.fetchone()[0] == 3
+    db_proj_info = _get_db_project_comment(
+        conn,
+        db_schema_base,
+    )
+    assert db_proj_info["version"] == "v2"
+
+    # change the GeoPackage as well and pull again
+    shutil.copy(
+        os.path.join(
+            TEST_DATA_DIR,
+            "inserted_1_A.gpkg",
+        ),
+        os.path.join(
+            project_dir,
+            "test_sync.gpkg",
+        ),
+    )
+    mc.push_project(project_dir)
+
+    dbsync_pull(mc)
+
+    cur = conn.cursor()
+    cur.execute(sql.SQL("SELECT count(*) from {}.simple").format(sql.Identifier(db_schema_main)))
+    assert cur.fetchone()[0] == 4
+    cur.execute(sql.SQL("SELECT count(*) from {}.simple").format(sql.Identifier(db_schema_base)))
+    assert cur.fetchone()[0] == 4
+    db_proj_info = _get_db_project_comment(
+        conn,
+        db_schema_base,
+    )
+    assert db_proj_info["version"] == "v3"
+
+
 def test_basic_push(
     mc: MerginClient,
 ):
@@ -18,53 +18,46 @@ def test_config():
     _reset_config()
     validate_config(config)
 
-    with pytest.raises(
-        ConfigError,
-        match="Config error: Incorrect mergin settings",
-    ):
+    with pytest.raises(ConfigError) as err:
         config.update({"MERGIN__USERNAME": None})
         validate_config(config)
+    assert str(err.value).startswith("Config error: Incorrect mergin settings")
 
     _reset_config()
-    with pytest.raises(
-        ConfigError,
-        match="Config error: Missing parameter `init_from` in the configuration",
-    ):
+    with pytest.raises(ConfigError) as err:
         config.unset(
             "init_from",
             force=True,
         )
         validate_config(config)
+    assert str(err.value).startswith("Config error: Missing parameter `init_from` in the configuration")
 
     _reset_config()
-    with pytest.raises(
-        ConfigError,
-        match="Config error: `init_from` parameter must be either `gpkg` or `db`",
-    ):
+    with pytest.raises(ConfigError) as err:
         config.update({"init_from": "anywhere"})
         validate_config(config)
+    assert str(err.value).startswith("Config error: `init_from` parameter must be either `gpkg` or `db`")
 
     _reset_config()
-    with pytest.raises(
-        ConfigError,
-        match="Config error: Connections list can not be empty",
-    ):
+    with pytest.raises(ConfigError) as err:
         config.update({"CONNECTIONS": []})
         validate_config(config)
+    assert str(err.value).startswith("Config error: Connections list can not be empty")
 
     _reset_config()
-    with pytest.raises(
-        ConfigError,
-        match="Config error: Incorrect connection settings",
-    ):
+    with pytest.raises(ConfigError) as err:
         config.update({"CONNECTIONS": [{"modified": "mergin_main"}]})
         validate_config(config)
+    assert str(err.value).startswith("Config error: Incorrect connection settings")
 
     _reset_config()
-    with pytest.raises(
-        ConfigError,
-        match="Config error: Only 'postgres' driver is currently supported.",
-    ):
+    with pytest.raises(ConfigError) as err:
+        config.update({"CONNECTIONS": ["postgres"]})
+        validate_config(config)
+    assert str(err.value).startswith("Config error: Incorrect connection settings")
+
+    _reset_config()
+    with pytest.raises(ConfigError) as err:
         config.update(
             {
                 "CONNECTIONS": [
@@ -80,12 +73,10 @@ def test_config():
             }
         )
         validate_config(config)
+    assert str(err.value).startswith("Config error: Only 'postgres' driver is currently supported.")
 
     _reset_config()
-    with pytest.raises(
-        ConfigError,
-        match="Config error: Name of the Mergin Maps project should be provided in the namespace/name format.",
-    ):
+    with pytest.raises(ConfigError) as err:
         config.update(
             {
                 "CONNECTIONS": [
@@ -101,6 +92,9 @@ def test_config():
             }
         )
         validate_config(config)
+    assert str(err.value).startswith(
+        "Config error: Name of the Mergin Maps project should be provided in the namespace/name format."
+    )
 
 
 def test_skip_tables():
@@ -267,8 +261,9 @@ def test_config_notification_setup():
         }
     )
 
-    with pytest.raises(ConfigError, match="Config error: `email_sender`"):
+    with pytest.raises(ConfigError) as err:
         validate_config(config)
+    assert str(err.value).startswith("Config error: `email_sender`")
 
     # another incomplete setting
     _reset_config()
@@ -284,8 +279,9 @@ def test_config_notification_setup():
         }
     )
 
-    with pytest.raises(ConfigError, match="Config error: `email_subject`"):
+    with pytest.raises(ConfigError) as err:
         validate_config(config)
+    assert str(err.value).startswith("Config error: `email_subject`")
 
     # bool variable test
     _reset_config()
@@ -304,8 +300,9 @@ def test_config_notification_setup():
         }
     )
 
-    with pytest.raises(ConfigError, match="Config error: `use_ssl` must be set to either `true` or `false`"):
+    with pytest.raises(ConfigError) as err:
         validate_config(config)
+    assert str(err.value).startswith("Config error: `use_ssl` must be set to either `true` or `false`")
 
     # int variable test
     _reset_config()
@@ -324,8 +321,9 @@ def test_config_notification_setup():
         }
     )
 
-    with pytest.raises(ConfigError, match="Config error: `smtp_port` must be set to an integer"):
+    with pytest.raises(ConfigError) as err:
         validate_config(config)
+    assert str(err.value).startswith("Config error: `smtp_port` must be set to an integer")
     # complete setting but does not work
     config.update(
         {
@@ -343,5 +341,50 @@ def test_config_notification_setup():
         }
     )
 
-    with pytest.raises(ConfigError, match="Config SMTP Error"):
+    with pytest.raises(ConfigError) as err:
         validate_config(config)
+    assert str(err.value).startswith("Config SMTP Error")
+
+
+def test_config_validation_cached(monkeypatch):
+    geodiff_calls = []
+
+    def run_geodiff(cmd, **kwargs):
+        geodiff_calls.append(cmd)
+        if cmd[0] == "missing-geodiff":
+            raise FileNotFoundError(cmd[0])
+
+    monkeypatch.setattr("config.subprocess.run", run_geodiff)
+    monkeypatch.setattr("config._last_valid_config_key", None)
+    geodiff_exe = config.geodiff_exe
+
+    _reset_config()
+    # left behind by the notification tests - checking it would need an SMTP server
+    config.unset(
+        "notification",
+        force=True,
+    )
+    validate_config(config)
+    assert len(geodiff_calls) == 1
+
+    # the same settings are not validated again
+    validate_config(config)
+    assert len(geodiff_calls) == 1
+
+    # changed settings are
+    config.update({"init_from": "db"})
+    validate_config(config)
+    assert len(geodiff_calls) == 2
+
+    # failed validation is not remembered
+    config.update({"geodiff_exe": "missing-geodiff"})
+    for _ in range(2):
+        with pytest.raises(ConfigError) as err:
+            validate_config(config)
+        assert str(err.value).startswith("Config error: Geodiff executable not found")
+    assert len(geodiff_calls) == 4
+
+    # back to the last valid settings
+    config.update({"geodiff_exe": geodiff_exe})
+    validate_config(config)
+    assert len(geodiff_calls) == 4
@@ -0,0 +1,198 @@
+import json
+import os
+import shutil
+import sqlite3
+
+import pygeodiff
+
+from config import config
+from dbsync import (
+    _geodiff_executable_command,
+    _geodiff_has_changes,
+    _geodiff_list_changes_details,
+)
+
+from .conftest import (
+    TEST_DATA_DIR,
+)
+
+
+def _create_changeset(
+    base_path,
+    modified_path,
+    changeset_path,
+):
+    geodiff = pygeodiff.GeoDiff()
+    geodiff.create_changeset(
+        base_path,
+        modified_path,
+        changeset_path,
+    )
+
+
+def _geodiff_list_changes_json(
+    changeset_path,
+    json_path,
+):
+    """Returns changes as listed by geodiff library itself (the same output as `geodiff as-json`)"""
+    geodiff = pygeodiff.GeoDiff()
+    geodiff.list_changes(
+        changeset_path,
+        json_path,
+    )
+    with open(json_path) as f:
+        return json.load(f)["geodiff"]
+
+
+def test_list_changes_details_insert(
+    tmp_path,
+):
+    changeset = os.path.join(tmp_path, "base2inserted")
+    _create_changeset(
+        os.path.join(TEST_DATA_DIR, "base.gpkg"),
+        os.path.join(TEST_DATA_DIR, "inserted_1_A.gpkg"),
+        changeset,
+    )
+
+    details = _geodiff_list_changes_details(changeset)
+
+    assert [change["type"] for change in details] == ["insert"]
+    assert details == _geodiff_list_changes_json(changeset, os.path.join(tmp_path, "changes.json"))
+
+
+def test_list_changes_details_update_delete(
+    tmp_path,
+):
+    modified_gpkg = os.path.join(tmp_path, "modified.gpkg")
+    shutil.copy(
+        os.path.join(TEST_DATA_DIR, "base.gpkg"),
+        modified_gpkg,
+    )
+    gpkg_conn = sqlite3.connect(modified_gpkg)
+    # GeoPackage triggers refer to these functions - they do not get called as geometries stay the same
+    for function_name in ["ST_IsEmpty", "ST_MinX", "ST_MaxX", "ST_MinY", "ST_MaxY"]:
+        gpkg_conn.create_function(function_name, 1, lambda geometry: 0)
+    gpkg_conn.execute("UPDATE simple SET rating = 42 WHERE fid = 1")
+    gpkg_conn.execute("DELETE FROM simple WHERE fid = 2")
+    gpkg_conn.commit()
+    gpkg_conn.close()
+
+    changeset = os.path.join(tmp_path, "base2modified")
+    _create_changeset(
+        os.path.join(TEST_DATA_DIR, "base.gpkg"),
+        modified_gpkg,
+        changeset,
+    )
+
+    details = _geodiff_list_changes_details(changeset)
+
+    assert sorted(change["type"] for change in details) == ["delete", "update"]
+    assert details == _geodiff_list_changes_json(changeset, os.path.join(tmp_path, "changes.json"))
+
+
+def test_has_changes(
+    tmp_path,
+):
+    base_gpkg = os.path.join(TEST_DATA_DIR, "base.gpkg")
+
+    changeset = os.path.join(tmp_path, "base2base")
+    _create_changeset(
+        base_gpkg,
+        base_gpkg,
+        changeset,
+    )
+    assert _geodiff_has_changes(changeset) is False
+
+    changeset = os.path.join(tmp_path, "base2inserted")
+    _create_changeset(
+        base_gpkg,
+        os.path.join(TEST_DATA_DIR, "inserted_1_A.gpkg"),
+        changeset,
+    )
+    assert _geodiff_has_changes(changeset) is True
+
+
+def test_geodiff_executable_command():
+    geodiff_exe = config.geodiff_exe
+
+    assert _geodiff_executable_command(
+        "create_changeset_ex",
+        [],
+        "postgres",
+        "dbname=db",
+        "base",
+        "modified",
+        "/tmp/changeset",
+    ) == [geodiff_exe, "diff", "--driver", "postgres", "dbname=db", "base", "modified", "/tmp/changeset"]
+
+    assert _geodiff_executable_command(
+        "rebase_ex",
+        ["table_a", "table_b"],
+        "postgres",
+        "dbname=db",
+        "base",
+        "modified",
+        "/tmp/base2their",
+        "/tmp/conflicts",
+    ) == [
+        geodiff_exe,
+        "rebase-db",
+        "--driver",
+        "postgres",
+        "dbname=db",
+        "--skip-tables",
+        "table_a;table_b",
+        "base",
+        "modified",
+        "/tmp/base2their",
+        "/tmp/conflicts",
+    ]
+
+    # library functions with two drivers take both drivers first, then the datasets
+    assert _geodiff_executable_command(
+        "make_copy",
+        ["table_a"],
+        "sqlite",
+        "",
+        "data.gpkg",
+        "postgres",
+        "dbname=db",
+        "base",
+    ) == [
+        geodiff_exe,
+        "copy",
+        "--driver-1",
+        "sqlite",
+        "",
+        "--driver-2",
+        "postgres",
+        "dbname=db",
+        "--skip-tables",
+        "table_a",
+        "data.gpkg",
+        "base",
+    ]
+
+    assert _geodiff_executable_command(
+        "create_changeset_dr",
+        [],
+        "postgres",
+        "dbname=db",
+        "base",
+        "sqlite",
+        "",
+        "data.gpkg",
+        "/tmp/changeset",
+    ) == [
+        geodiff_exe,
+        "diff",
+        "--driver-1",
+        "postgres",
+        "dbname=db",
+        "--driver-2",
+        "sqlite",
+        "",
+        "base",
+        "data.gpkg",
+        "/tmp/changeset",
+    ]